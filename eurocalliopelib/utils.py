@@ -1,33 +1,103 @@
 """Utility functions."""
 
+import functools
 import logging
-from typing import Literal, Optional
+from dataclasses import dataclass
+from typing import Literal, NamedTuple, Optional
 
+import numpy as np
 import pandas as pd
 import pycountry
 import xarray as xr
 
+try:
+    import numpy_groupies as npg
+except ImportError:  # optional dependency, we fall back to flox or xarray without it
+    npg = None
+try:
+    import flox.xarray
+except ImportError:  # optional dependency, we fall back to xarray's groupby without it
+    flox = None
+
 LOGGER = logging.getLogger(__name__)
 
+_COUNTRY_ALIASES = {  # non-ISO country codes -> ISO alpha2
+    "el": "gr",
+    "uk": "gb",
+    "bh": "ba",  # this is a weird country code used in the biofuels dataset
+}
+_ALPHA2_TO_EU = {"GB": "UK", "GR": "EL"}  # ISO alpha2 -> EU country codes, if different
+_COUNTRY_LOOKUP_FIELDS = (  # pycountry fields to look countries up by, in order of precedence
+    "alpha_2",
+    "alpha_3",
+    "numeric",
+    "name",
+    "official_name",
+    "common_name",
+)
+_COUNTRY_OUTPUT_FORMATS = {  # output format -> getter on a country record
+    "alpha2": lambda record: record.alpha_2,
+    "alpha2_eu": lambda record: _ALPHA2_TO_EU.get(record.alpha_2, record.alpha_2),
+    "alpha3": lambda record: record.alpha_3,
+    "name": lambda record: record.name,
+}
+
 
 def eu_country_code_to_iso3(eu_country_code):
     """Converts EU country code to ISO 3166 alpha 3.
     The European Union uses its own country codes, which often but not always match ISO 3166.
     """
-    assert (
-        len(eu_country_code) == 2
-    ), f"EU country codes are of length 2, yours is '{eu_country_code}'."
+    if len(eu_country_code) != 2:
+        raise ValueError(
+            f"EU country codes are of length 2, yours is '{eu_country_code}'."
+        )
 
     return convert_country_code(eu_country_code, output="alpha3")
 
 
+class _Country(NamedTuple):
+    alpha_2: str
+    alpha_3: str
+    name: str
+
+
+@functools.lru_cache(maxsize=None)
+def _country_table() -> dict:
+    """
+    Map lower-cased codes and names of all pycountry countries to their country record.
+    Built on first use, so that importing this module does not load pycountry's database.
+    """
+    table = {}
+    for field in _COUNTRY_LOOKUP_FIELDS:
+        for country in pycountry.countries:
+            value = getattr(country, field, None)
+            if value is not None:
+                table.setdefault(
+                    value.lower(),
+                    _Country(country.alpha_2, country.alpha_3, country.name),
+                )
+    return table
+
+
+def _lookup_country(code_lower: str) -> _Country:
+    """
+    Look up a lower-cased country code/name.
+    Equivalent to `pycountry.countries.lookup`, but with a single dict lookup instead of searching pycountry's records.
+    """
+    try:
+        return _country_table()[code_lower]
+    except KeyError:
+        raise LookupError(f"Could not find a record for {code_lower!r}") from None
+
+
+@functools.lru_cache(maxsize=None)
 def convert_country_code(
     input_country: str,
     output: Literal["alpha2", "alpha2_eu", "alpha3", "name"] = "alpha3",
 ) -> str:
     """
     Converts input country code or name into a 2- or 3-letter code or a normalised pycountry name.
-
+    Results are cached, as the same few countries are usually converted many times over.
 
     Args:
         input_country (str): Country code/name to convert. Can accept an EU country code.
@@ -41,37 +111,19 @@ def convert_country_code(
 
     Returns:
         str: Input country converted to output format.
-    """
 
-    if input_country.lower() == "el":
-        input_country = "gr"
-    elif input_country.lower() == "uk":
-        input_country = "gb"
-    elif (
-        input_country.lower() == "bh"
-    ):  # this is a weird country code used in the biofuels dataset
-        input_country = "ba"
-
-    lookup = pycountry.countries.lookup(input_country)
-    if output == "alpha2":
-        converted = lookup.alpha_2
-
-    if output == "alpha2_eu":
-        alpha2 = lookup.alpha_2
-        if alpha2 == "GB":
-            converted = "UK"
-        elif alpha2 == "GR":
-            converted = "EL"
-        else:
-            converted = alpha2
-
-    if output == "alpha3":
-        converted = lookup.alpha_3
+    Raises:
+        ValueError: If `output` is not one of the options above.
+        LookupError: If `input_country` is not a known country.
+    """
 
-    if output == "name":
-        converted = lookup.name
+    try:
+        get_output = _COUNTRY_OUTPUT_FORMATS[output]
+    except KeyError:
+        raise ValueError(f"Unknown output format: {output}") from None
 
-    return converted
+    lowered = input_country.lower()
+    return get_output(_lookup_country(_COUNTRY_ALIASES.get(lowered, lowered)))
 
 
 def convert_valid_countries(
@@ -96,19 +148,80 @@ def convert_valid_countries(
         dict: Mapping from input country code/name to output country code for all valid input countries
     """
 
-    mapped_codes = {}
-    for country_code in country_codes:
-        try:
-            mapped_codes[country_code] = convert_country_code(
-                country_code, output=output
-            )
-        except LookupError as err:
-            if errors == "raise":
-                raise err
-            elif errors == "ignore":
+    country_codes = list(country_codes)
+    unique_codes = pd.Index(country_codes).unique()
+    if errors == "raise":
+        mapped_codes = {
+            country_code: convert_country_code(country_code, output=output)
+            for country_code in unique_codes
+        }
+    elif errors == "ignore":
+        mapped_codes = {}
+        for country_code in unique_codes:
+            try:
+                mapped_codes[country_code] = convert_country_code(
+                    country_code, output=output
+                )
+            except LookupError:
                 LOGGER.info(f"Skipping country/region {country_code}")
-                continue
-    return mapped_codes
+    else:
+        raise ValueError(f"Unknown value for `errors`: {errors}")
+
+    return {
+        country_code: mapped_codes[country_code]
+        for country_code in country_codes
+        if country_code in mapped_codes
+    }
+
+
+@dataclass(frozen=True, eq=False)
+class RenameMapper:
+    """
+    Mapping from dimension items to (possibly shared) new names, prepared for grouping.
+    Build it once with `build_rename_mapper` and apply it to any number of dataarrays with `rename_and_groupby_with_mapper`.
+    Mappers compare and hash by identity, so they can be used as dict keys or cached function arguments.
+
+    Attributes:
+        items (pd.Index): Dimension items to rename.
+        codes (np.ndarray): Position in `new_coord` of the new name of each item in `items`.
+        new_coord (np.ndarray): Sorted, unique new names.
+        dim_name (str): Dimension on which to rename items.
+        new_dim_name (Optional[str]): If not None, the name given to the dimension "dim_name".
+    """
+
+    items: pd.Index
+    codes: np.ndarray
+    new_coord: np.ndarray
+    dim_name: str
+    new_dim_name: Optional[str] = None
+
+
+def build_rename_mapper(
+    rename_dict: dict, dim_name: str, new_dim_name: Optional[str] = None
+) -> RenameMapper:
+    """
+    Prepare `rename_dict` for use in `rename_and_groupby_with_mapper`.
+    This is worthwhile when the same renaming is applied to several dataarrays.
+
+    Args:
+        rename_dict (dict):
+            Dictionary to map items in the dimension `dim_name` to new names ({"old_item_name": "new_item_name"}).
+        dim_name (str):
+            Dimension on which to rename items.
+        new_dim_name (Optional[str], optional): Defaults to None.
+            If not None, rename the dimension "dim_name" to the given string.
+    Returns:
+        (RenameMapper): Mapper to pass to `rename_and_groupby_with_mapper`.
+    """
+    codes, new_coord = pd.factorize(pd.Series(rename_dict), sort=True)
+    has_group = codes != -1  # items renamed to None/NaN are dropped
+    return RenameMapper(
+        items=pd.Index(rename_dict.keys())[has_group],
+        codes=codes[has_group],
+        new_coord=np.asarray(new_coord),
+        dim_name=dim_name,
+        new_dim_name=new_dim_name,
+    )
 
 
 def rename_and_groupby(
@@ -118,6 +231,8 @@ def rename_and_groupby(
     new_dim_name: Optional[str] = None,
     dropna: bool = False,
     drop_other_dim_items: bool = True,
+    min_count: Optional[int] = 1,
+    method: Optional[str] = "cohorts",
 ) -> xr.DataArray:
     """
     Take an xarray dataarray and rename the contents of a given dimension as well as (optionally) rename that dimension.
@@ -137,27 +252,77 @@ def rename_and_groupby(
             If True, drop any items in "dim_name" after renaming/grouping which have all NaN values along all other dimensions.
         drop_other_dim_items (bool, optional): Defaults to True.
             If True, any dimension items _not_ referenced in `rename_dict` keys will be removed from that dimension in the returned array.
+        min_count (Optional[int], optional): Defaults to 1.
+            Minimum number of non-NaN values needed in a group for its sum not to be NaN.
+            If None or 0, groups with only NaN values sum to 0 instead, so they will not be removed by `dropna`.
+        method (Optional[str], optional): Defaults to "cohorts".
+            Strategy passed on to `flox`, if `flox` is installed and is used for grouping.
+            That is the case for dask-backed and non-float arrays, and for all arrays if `numpy_groupies` is not installed.
+            Otherwise, `method` is ignored.
+            "cohorts" suits the typical case of many small groups. If None, `flox` chooses itself.
     Returns:
         (xr.DataArray): Same as "da" but with the items in "dim_name" renamed and possibly a. grouped and summed, b. "dim_name" itself renamed.
     """
-    rename_series = pd.Series(rename_dict).rename_axis(index=dim_name)
     if drop_other_dim_items is False:
-        existing_dim_items = da[dim_name].to_series()
-        rename_series = rename_series.reindex(existing_dim_items).fillna(
-            existing_dim_items
-        )
+        rename_dict = {  # items not renamed, or renamed to None/NaN, keep their name
+            item: item if pd.isna(rename_dict.get(item)) else rename_dict[item]
+            for item in da.indexes[dim_name]
+        }
+    mapper = build_rename_mapper(rename_dict, dim_name, new_dim_name)
+    return rename_and_groupby_with_mapper(
+        da, mapper, dropna=dropna, min_count=min_count, method=method
+    )
 
-    if new_dim_name is None:
+
+def rename_and_groupby_with_mapper(
+    da: xr.DataArray,
+    mapper: RenameMapper,
+    dropna: bool = False,
+    min_count: Optional[int] = 1,
+    method: Optional[str] = "cohorts",
+) -> xr.DataArray:
+    """
+    Same as `rename_and_groupby` with `drop_other_dim_items=True`, but using a mapper from `build_rename_mapper`.
+    The mapper can be reused across dataarrays, so the renaming is only prepared once.
+
+    Args:
+        da (xr.DataArray):
+            Input dataarray with the dimension `mapper.dim_name`.
+        mapper (RenameMapper):
+            Renaming to apply, from `build_rename_mapper`.
+        dropna (bool, optional): Defaults to False.
+            If True, drop any items in the renamed dimension which have all NaN values along all other dimensions.
+        min_count (Optional[int], optional): Defaults to 1.
+            Minimum number of non-NaN values needed in a group for its sum not to be NaN, see `rename_and_groupby`.
+        method (Optional[str], optional): Defaults to "cohorts".
+            Strategy passed on to `flox`, if `flox` is used for grouping, see `rename_and_groupby`.
+    Returns:
+        (xr.DataArray): Same as "da" but with the items in "mapper.dim_name" renamed and possibly a. grouped and summed, b. "mapper.dim_name" itself renamed.
+    """
+    dim_name = mapper.dim_name
+    if mapper.new_dim_name is None:
         new_dim_name = f"_{dim_name}"  # placeholder that we'll revert
         revert_dim_name = True
     else:
+        new_dim_name = mapper.new_dim_name
         revert_dim_name = False
 
-    rename_da = xr.DataArray(rename_series.rename(new_dim_name))
-    da = (
-        da.reindex({dim_name: rename_da[dim_name]})
-        .groupby(rename_da)
-        .sum(dim_name, skipna=True, min_count=1, keep_attrs=True)
+    # Select existing items by position rather than reindexing, which would
+    # allocate an all-NaN slab for every mapped item missing from `da`.
+    item_positions = mapper.items.get_indexer(da.indexes[dim_name])
+    # If nothing is there to group, we only need the all-NaN groups
+    if (item_positions == -1).all():
+        da = da.reindex({dim_name: mapper.items})
+        item_positions = np.arange(len(mapper.items))
+    found = np.flatnonzero(item_positions != -1)
+    da = _groupby_sum(
+        da.isel({dim_name: found}),
+        mapper.codes[item_positions[found]],
+        mapper.new_coord,
+        dim_name,
+        new_dim_name,
+        min_count=min_count,
+        method=method,
     )
     if revert_dim_name:
         da = da.rename({new_dim_name: dim_name})
@@ -167,6 +332,101 @@ def rename_and_groupby(
     return da
 
 
+def _groupby_sum(
+    da: xr.DataArray,
+    codes: np.ndarray,
+    groups: np.ndarray,
+    dim_name: str,
+    new_dim_name: str,
+    min_count: Optional[int] = 1,
+    method: Optional[str] = "cohorts",
+) -> xr.DataArray:
+    """
+    Group `da` along `dim_name` and sum, with `codes` giving the position in `groups` of the group of each item.
+    Items with a code of -1 do not belong to any group and are ignored.
+    The result has the dimension `new_dim_name` instead of `dim_name`, with `groups` as items.
+    Groups with fewer than `min_count` non-NaN values (including groups without any items in `da`)
+    are NaN in the result. If `min_count` is None or 0, they are 0 instead.
+
+    In-memory float arrays are aggregated in one go with `numpy_groupies` (if installed),
+    which is much faster than xarray's groupby when there are many items in `dim_name`.
+    Anything else (dask-backed or non-float arrays, or all arrays without `numpy_groupies`)
+    goes through `flox` using `method` (if installed and `groups` can be sorted)
+    or else through xarray's groupby, which ignores `method`.
+    """
+    has_group = codes != -1  # items without a group are dropped, as in xarray's groupby
+    if not has_group.all():
+        da = da.isel({dim_name: has_group})
+        codes = codes[has_group]
+
+    min_count = min_count or None  # 0 means the same as None, on every path
+    empty_group_value = np.nan if min_count else 0
+    if npg is None or da.chunks is not None or not np.issubdtype(da.dtype, np.floating):
+        group_da = xr.DataArray(
+            groups[codes],
+            dims=dim_name,
+            coords={dim_name: da[dim_name]},
+            name=new_dim_name,
+        )
+        if flox is not None and _is_sortable(groups):  # flox always sorts groups
+            return flox.xarray.xarray_reduce(
+                da,
+                group_da,
+                func="sum",
+                expected_groups=groups,
+                dim=dim_name,
+                fill_value=empty_group_value,
+                skipna=True,
+                min_count=min_count,
+                method=method,
+                keep_attrs=True,
+            )
+        summed = da.groupby(group_da).sum(
+            dim_name, skipna=True, min_count=min_count, keep_attrs=True
+        )
+        if summed.sizes[new_dim_name] != len(groups):
+            summed = summed.reindex(
+                {new_dim_name: groups}, fill_value=empty_group_value
+            )
+        return summed
+
+    # `nansum` gives `fill_value` for groups without any non-NaN values,
+    # so we only need to count values ourselves if `min_count` is above 1.
+    axis = da.get_axis_num(dim_name)
+    values = da.values
+    summed = npg.aggregate(
+        codes,
+        values,
+        func="nansum",
+        axis=axis,
+        size=len(groups),
+        fill_value=empty_group_value,
+        dtype=da.dtype,
+    )
+    if min_count is not None and min_count > 1:
+        counts = npg.aggregate(
+            codes, ~np.isnan(values), func="sum", axis=axis, size=len(groups)
+        )
+        summed[counts < min_count] = np.nan
+
+    dims = list(da.dims)
+    dims[axis] = new_dim_name
+    coords = {
+        name: coord for name, coord in da.coords.items() if dim_name not in coord.dims
+    }
+    coords[new_dim_name] = groups
+    return xr.DataArray(summed, dims=dims, coords=coords, name=da.name, attrs=da.attrs)
+
+
+def _is_sortable(array: np.ndarray) -> bool:
+    """Check whether `array` can be sorted, i.e., it does not mix incomparable types (e.g. str and int)."""
+    try:
+        np.sort(array)
+    except TypeError:
+        return False
+    return True
+
+
 def ktoe_to_twh(array):
     """Convert KTOE to TWH"""
     return array * 1.163e-2
@@ -184,7 +444,7 @@ def pj_to_twh(array):
 
 def tj_to_twh(array):
     """Convert TJ to TWh"""
-    return pj_to_twh(array) / 1000
+    return array / 3600
 
 
 def tj_to_ktoe(array):
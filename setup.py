@@ -23,6 +23,10 @@ setup(
             "rasterio", # TODO readd after solving #262
             "rasterstats", # TODO readd after solving #262
         ],
+        "fast": [
+            "numpy_groupies",
+            "flox",
+        ],
     },
     entry_points={
         "mkdocs.plugins": [
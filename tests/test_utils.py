@@ -0,0 +1,218 @@
+import numpy as np
+import pycountry
+import pytest
+import xarray as xr
+
+from eurocalliopelib import utils
+
+
+class TestEuCountryCodeToIso3:
+    def test_eu_code(self):
+        assert utils.eu_country_code_to_iso3("EL") == "GRC"
+
+    def test_wrong_length(self):
+        with pytest.raises(ValueError, match="length 2"):
+            utils.eu_country_code_to_iso3("FRA")
+
+
+class TestConvertCountryCode:
+    @pytest.mark.parametrize(
+        "field",
+        ["alpha_2", "alpha_3", "numeric", "name", "official_name", "common_name"],
+    )
+    def test_matches_pycountry_lookup(self, field):
+        for country in pycountry.countries:
+            value = getattr(country, field, None)
+            # aliases deliberately differ from pycountry (e.g. "BH" is Bahrain in ISO)
+            if value is None or value.lower() in utils._COUNTRY_ALIASES:
+                continue
+            for variant in [value, value.lower(), value.upper()]:
+                assert (
+                    utils.convert_country_code(variant)
+                    == pycountry.countries.lookup(variant).alpha_3
+                )
+
+    @pytest.mark.parametrize(
+        ("code", "expected"), [("el", "GRC"), ("UK", "GBR"), ("BH", "BIH")]
+    )
+    def test_aliases(self, code, expected):
+        assert utils.convert_country_code(code) == expected
+
+    @pytest.mark.parametrize(
+        ("code", "expected"), [("GRC", "EL"), ("gb", "UK"), ("France", "FR")]
+    )
+    def test_alpha2_eu(self, code, expected):
+        assert utils.convert_country_code(code, output="alpha2_eu") == expected
+
+    def test_unknown_country(self):
+        with pytest.raises(LookupError):
+            utils.convert_country_code("EU27")
+
+    def test_unknown_output(self):
+        with pytest.raises(ValueError, match="output"):
+            utils.convert_country_code("FR", output="alpha4")
+
+
+class TestConvertValidCountries:
+    def test_duplicates_and_aliases(self):
+        mapped = utils.convert_valid_countries(["FR", "France", "UK", "EL", "FR"])
+        assert mapped == {"FR": "FRA", "France": "FRA", "UK": "GBR", "EL": "GRC"}
+
+    def test_generator_input(self):
+        mapped = utils.convert_valid_countries(code for code in ["FR", "DE", "FR"])
+        assert mapped == {"FR": "FRA", "DE": "DEU"}
+
+    def test_errors_raise(self):
+        with pytest.raises(LookupError):
+            utils.convert_valid_countries(["FR", "EU27"])
+
+    def test_errors_ignore(self):
+        mapped = utils.convert_valid_countries(["FR", "EU27"], errors="ignore")
+        assert mapped == {"FR": "FRA"}
+
+    def test_errors_unknown(self):
+        with pytest.raises(ValueError, match="errors"):
+            utils.convert_valid_countries(["FR"], errors="warn")
+
+
+AGGREGATION_PATHS = ["numpy_groupies", "flox", "xarray"]
+
+
+def rename_and_groupby_on_path(path, *args, **kwargs):
+    """Run `rename_and_groupby` with only the optional packages of the given aggregation path available."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        if path == "numpy_groupies" and utils.npg is None:
+            pytest.skip("numpy_groupies is not installed")
+        if path == "flox" and utils.flox is None:
+            pytest.skip("flox is not installed")
+        if path != "numpy_groupies":
+            monkeypatch.setattr(utils, "npg", None)
+        if path == "xarray":
+            monkeypatch.setattr(utils, "flox", None)
+        return utils.rename_and_groupby(*args, **kwargs).compute()
+
+
+class TestRenameAndGroupby:
+    @pytest.fixture
+    def da(self):
+        return xr.DataArray(
+            [[1.0, 2.0], [np.nan, np.nan], [3.0, np.nan], [4.0, 5.0], [6.0, 7.0]],
+            dims=("country", "year"),
+            coords={"country": ["FR", "DE", "BE", "NL", "IT"], "year": [2020, 2021]},
+            attrs={"unit": "twh"},
+            name="demand",
+        )
+
+    @pytest.fixture
+    def rename_dict(self):
+        # "LU" is not in `da`
+        return {"FR": "W", "BE": "W", "DE": "C", "NL": "N", "LU": "L"}
+
+    @pytest.mark.parametrize("path", AGGREGATION_PATHS)
+    def test_groups_and_sums(self, da, rename_dict, path):
+        renamed = rename_and_groupby_on_path(path, da, rename_dict, "country")
+        expected = xr.DataArray(
+            [[np.nan, np.nan], [np.nan, np.nan], [4.0, 5.0], [4.0, 2.0]],
+            dims=("country", "year"),
+            coords={"country": ["C", "L", "N", "W"], "year": [2020, 2021]},
+            attrs={"unit": "twh"},
+            name="demand",
+        )
+        xr.testing.assert_identical(renamed, expected)
+
+    @pytest.mark.parametrize("path", AGGREGATION_PATHS[:-1])
+    @pytest.mark.parametrize("dropna", [True, False])
+    @pytest.mark.parametrize("drop_other_dim_items", [True, False])
+    @pytest.mark.parametrize("new_dim_name", [None, "region"])
+    @pytest.mark.parametrize("min_count", [None, 0, 1, 2])
+    def test_paths_identical(
+        self,
+        da,
+        rename_dict,
+        path,
+        dropna,
+        drop_other_dim_items,
+        new_dim_name,
+        min_count,
+    ):
+        kwargs = dict(
+            rename_dict=rename_dict,
+            dim_name="country",
+            new_dim_name=new_dim_name,
+            dropna=dropna,
+            drop_other_dim_items=drop_other_dim_items,
+            min_count=min_count,
+        )
+        xr.testing.assert_identical(
+            rename_and_groupby_on_path(path, da, **kwargs),
+            rename_and_groupby_on_path("xarray", da, **kwargs),
+        )
+
+    @pytest.mark.parametrize("path", AGGREGATION_PATHS[:-1])
+    def test_paths_identical_int(self, da, path):
+        da = da.fillna(0).astype(int)
+        rename_dict = {"FR": "W", "BE": "W", "DE": "C"}
+        xr.testing.assert_identical(
+            rename_and_groupby_on_path(path, da, rename_dict, "country"),
+            rename_and_groupby_on_path("xarray", da, rename_dict, "country"),
+        )
+
+    @pytest.mark.parametrize("path", AGGREGATION_PATHS[:-1])
+    def test_paths_identical_dask(self, da, rename_dict, path):
+        pytest.importorskip("dask")
+        da = da.chunk({"year": 1})
+        xr.testing.assert_identical(
+            rename_and_groupby_on_path(path, da, rename_dict, "country"),
+            rename_and_groupby_on_path("xarray", da, rename_dict, "country"),
+        )
+
+    @pytest.mark.parametrize("path", AGGREGATION_PATHS)
+    def test_null_new_names_are_dropped(self, da, path):
+        rename_dict = {"FR": "W", "DE": None, "IT": np.nan}
+        renamed = rename_and_groupby_on_path(path, da, rename_dict, "country")
+        expected = da.sel(country=["FR"]).assign_coords(country=["W"])
+        xr.testing.assert_identical(renamed, expected)
+
+    @pytest.mark.parametrize("path", AGGREGATION_PATHS)
+    def test_null_new_names_keep_name_with_other_items(self, da, path):
+        rename_dict = {"FR": "W", "DE": None, "IT": np.nan}
+        renamed = rename_and_groupby_on_path(
+            path, da, rename_dict, "country", drop_other_dim_items=False
+        )
+        expected = da.assign_coords(country=["W", "DE", "BE", "NL", "IT"]).sortby(
+            "country"
+        )
+        xr.testing.assert_identical(renamed, expected)
+
+    @pytest.mark.parametrize("path", AGGREGATION_PATHS)
+    @pytest.mark.parametrize("dtype", [float, int])
+    def test_mixed_type_new_names(self, da, path, dtype):
+        da = da.fillna(0).astype(dtype)
+        rename_dict = {"FR": 1, "BE": 1, "DE": 2}
+        renamed = rename_and_groupby_on_path(
+            path, da, rename_dict, "country", drop_other_dim_items=False
+        )
+        assert renamed.country.values.tolist() == [1, 2, "IT", "NL"]
+        np.testing.assert_array_equal(renamed.values, [[4, 2], [0, 0], [6, 7], [4, 5]])
+
+
+class TestRenameMapper:
+    def test_reuse_across_dataarrays(self):
+        mapper = utils.build_rename_mapper({"FR": "W", "BE": "W", "DE": "C"}, "country")
+        for countries in [["FR", "BE"], ["FR", "BE", "DE", "NL"]]:
+            da = xr.DataArray(
+                np.ones(len(countries)), dims="country", coords={"country": countries}
+            )
+            expected = utils.rename_and_groupby(
+                da, {"FR": "W", "BE": "W", "DE": "C"}, "country"
+            )
+            xr.testing.assert_identical(
+                utils.rename_and_groupby_with_mapper(da, mapper), expected
+            )
+
+    def test_hashable(self):
+        mapper = utils.build_rename_mapper({"FR": "W"}, "country")
+        other = utils.build_rename_mapper({"FR": "W"}, "country")
+        assert {mapper: 1}[mapper] == 1
+        assert mapper == mapper
+        assert mapper != other